@@ -0,0 +1,76 @@
+"""将上游CSV转换为Parquet镜像
+
+定时运行（例如每天一次的cron或CI任务）：
+
+    PARQUET_MIRROR_URL=s3://bucket/real-estate python prefetch.py
+
+服务端设置相同的PARQUET_MIRROR_URL后优先读取镜像文件。
+写入S3等远程存储需要安装对应的fsspec实现（如s3fs）。
+"""
+import logging
+import os
+import tempfile
+from typing import BinaryIO, Callable
+
+import httpx
+import pandas as pd
+
+from server import (
+    PARQUET_MIRROR_URL,
+    REALTOR_URLS,
+    SPOOL_MAX_BYTES,
+    ZILLOW_AFFORDABILITY_URLS,
+    parquet_mirror_path,
+    parse_realtor_csv,
+    parse_zillow_csv,
+)
+
+logger = logging.getLogger(__name__)
+
+def convert_csv(name: str, url: str, parse: Callable[[BinaryIO], pd.DataFrame]) -> None:
+    """下载CSV，解析后写入Parquet镜像"""
+    logger.info("Fetching data from %s", url)
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as buffer:
+        with httpx.stream('GET', url, timeout=120.0) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes():
+                buffer.write(chunk)
+        buffer.seek(0)
+        df = parse(buffer)
+
+    path = parquet_mirror_path(name)
+    df.to_parquet(path, engine='pyarrow', compression='zstd', index=False)
+    logger.info("Wrote %d rows to %s", len(df), path)
+
+def convert_realtor_data(granularity: str) -> None:
+    """下载Realtor.com CSV并写入Parquet镜像"""
+    convert_csv(
+        f"realtor_{granularity}",
+        REALTOR_URLS[granularity],
+        lambda buffer: parse_realtor_csv(buffer, granularity)
+    )
+
+def convert_zillow_data(data_type: str) -> None:
+    """下载Zillow可负担性CSV并写入Parquet镜像，只保留RegionName和日期列"""
+    convert_csv(
+        f"zillow_{data_type}",
+        ZILLOW_AFFORDABILITY_URLS[data_type],
+        lambda buffer: parse_zillow_csv(buffer, data_type).reset_index()
+    )
+
+def main() -> None:
+    if not PARQUET_MIRROR_URL:
+        raise SystemExit("PARQUET_MIRROR_URL is not set")
+
+    # 本地目录需要先创建
+    if '://' not in PARQUET_MIRROR_URL:
+        os.makedirs(PARQUET_MIRROR_URL, exist_ok=True)
+
+    for granularity in REALTOR_URLS:
+        convert_realtor_data(granularity)
+
+    for data_type in ZILLOW_AFFORDABILITY_URLS:
+        convert_zillow_data(data_type)
+
+if __name__ == "__main__":
+    main()
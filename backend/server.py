@@ -1,20 +1,39 @@
-from fastapi import FastAPI, Query, Path
+from fastapi import FastAPI, Query, Path, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 import httpx
+import orjson
 import asyncio
 import pandas as pd
-from io import StringIO
-from typing import List, Dict, Optional, Tuple
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+import tempfile
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import reduce
+from typing import Awaitable, BinaryIO, Callable, List, Dict, Optional, Tuple
+from cachetools import TTLCache
 from datetime import datetime, timedelta
 import numpy as np
 from fastapi import HTTPException
 import re
 import os
+import logging
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI()
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await close_http_client()
+
+# 使用orjson序列化响应，比标准库json快且原生支持NumPy类型，NaN输出为null
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # 添加CORS中间件
 app.add_middleware(
@@ -28,6 +47,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 压缩较大的JSON响应
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # 数据URL
 REALTOR_URLS = {
     'national': 'https://econdata.s3-us-west-2.amazonaws.com/Reports/Core/RDC_Inventory_Core_Metrics_Country_History.csv',
@@ -61,325 +83,406 @@ REGION_COLUMNS = {
     'zip': 'postal_code'
 }
 
+# 数据缓存：上游CSV最多每月更新一次，解析后的DataFrame在进程内缓存
+CACHE_TTL_SECONDS = int(os.getenv('DATA_CACHE_TTL_SECONDS', '21600'))
+
+_dataframe_cache: TTLCache = TTLCache(
+    maxsize=len(REALTOR_URLS) + len(ZILLOW_AFFORDABILITY_URLS),
+    ttl=CACHE_TTL_SECONDS
+)
+# 数据接口的缓存头，允许CDN边缘节点缓存与进程内缓存相同的时间
+CACHE_CONTROL = f"public, max-age={CACHE_TTL_SECONDS}"
+
+# 每个缓存键一把锁，避免并发请求重复下载同一个文件
+_cache_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+# 上次下载的ETag/Last-Modified及对应的DataFrame，缓存过期后用于条件请求
+_cache_validators: Dict[str, Tuple[Dict[str, str], pd.DataFrame]] = {}
+# 下载内容超过该大小才写入磁盘
+SPOOL_MAX_BYTES = 64 << 20
+
+# 共享的HTTP客户端，复用连接池避免每次下载重新进行TLS握手。
+# 连接池绑定在创建它的事件循环上，而Serverless环境（如Vercel）可能每次调用都使用新的事件循环，
+# 因此事件循环变化时重新创建客户端
+_http_client: Optional[Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取当前事件循环上的共享HTTP客户端"""
+    global _http_client
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client[0] is not loop:
+        _http_client = (loop, httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20)
+        ))
+    return _http_client[1]
+
+async def close_http_client() -> None:
+    """关闭当前事件循环上的HTTP客户端"""
+    global _http_client
+    if _http_client is not None and _http_client[0] is asyncio.get_running_loop():
+        await _http_client[1].aclose()
+    _http_client = None
+
+# Parquet镜像位置（由prefetch.py生成），未设置时直接读取上游CSV
+PARQUET_MIRROR_URL = os.getenv('PARQUET_MIRROR_URL', '').rstrip('/')
+
+REALTOR_NUMERIC_COLUMNS = ['month_date_yyyymm', 'active_listing_count', 'pending_listing_count',
+                           'median_days_on_market', 'price_reduced_count']
+
+# 缓存数据使用32位类型，计数值在float32精度范围内
+REALTOR_DTYPES = {
+    'month_date_yyyymm': 'int32',
+    **{col: 'float32' for col in REALTOR_NUMERIC_COLUMNS[1:]}
+}
+
+async def get_cached_dataframe(
+    cache_key: str,
+    load: Callable[[], Awaitable[pd.DataFrame]]
+) -> pd.DataFrame:
+    """按cache_key缓存load()的结果CACHE_TTL_SECONDS秒，空数据不缓存"""
+    df = _dataframe_cache.get(cache_key)
+    if df is not None:
+        return df
+
+    async with _cache_locks[cache_key]:
+        # 等待锁期间可能已有其他请求完成加载
+        df = _dataframe_cache.get(cache_key)
+        if df is not None:
+            return df
+
+        df = await load()
+        if not df.empty:
+            _dataframe_cache[cache_key] = df
+        return df
+
+async def download_csv_dataframe(
+    cache_key: str,
+    url: str,
+    timeout: float,
+    parse: Callable[[BinaryIO], pd.DataFrame]
+) -> pd.DataFrame:
+    """下载并解析CSV；上游未更新（304）时复用上次的解析结果"""
+    headers = {}
+    previous = _cache_validators.get(cache_key)
+    if previous is not None:
+        validators = previous[0]
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last-modified' in validators:
+            headers['If-Modified-Since'] = validators['last-modified']
+
+    logger.info("Fetching data from %s", url)
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as buffer:
+        # 边下载边写入缓冲区，避免把整个响应解码成str
+        async with get_http_client().stream('GET', url, headers=headers, timeout=timeout) as response:
+            if response.status_code == 304 and previous is not None:
+                logger.info("%s 未更新，继续使用缓存数据", url)
+                return previous[1]
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                buffer.write(chunk)
+            validators = {
+                key: response.headers[key]
+                for key in ('etag', 'last-modified')
+                if key in response.headers
+            }
+
+        if buffer.tell() == 0:
+            logger.warning("Empty response")
+            return pd.DataFrame()
+        buffer.seek(0)
+        # 解析在线程中执行，不阻塞事件循环
+        df = await asyncio.to_thread(parse, buffer)
+
+    if not df.empty:
+        _cache_validators[cache_key] = (validators, df)
+    return df
+
+def parquet_mirror_path(name: str) -> str:
+    """Parquet镜像文件路径"""
+    return f"{PARQUET_MIRROR_URL}/{name}.parquet"
+
+async def read_parquet_mirror(name: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    """读取Parquet镜像，未配置镜像或读取失败时返回None"""
+    if not PARQUET_MIRROR_URL:
+        return None
+    
+    path = parquet_mirror_path(name)
+    try:
+        logger.info("Loading data from %s", path)
+        return await asyncio.to_thread(pd.read_parquet, path, columns=columns, engine='pyarrow')
+    except Exception as e:
+        logger.warning("Error loading %s, falling back to CSV: %s", path, e)
+        return None
+
+def skip_invalid_csv_row(row: pa_csv.InvalidRow) -> str:
+    """跳过列数不匹配的行（例如文件末尾的说明文字）"""
+    return 'skip'
+
 @app.get("/api/zillow-data")
 async def get_zillow_data():
-    async with httpx.AsyncClient() as client:
-        try:
-            responses = await asyncio.gather(
-                client.get(ZILLOW_URLS['allHomes']),
-                client.get(ZILLOW_URLS['sfrOnly'])
-            )
-            
-            return {
-                "allHomes": responses[0].text,
-                "sfrOnly": responses[1].text
+    try:
+        client = get_http_client()
+        responses = await asyncio.gather(
+            client.get(ZILLOW_URLS['allHomes']),
+            client.get(ZILLOW_URLS['sfrOnly'])
+        )
+        
+        return {
+            "allHomes": responses[0].text,
+            "sfrOnly": responses[1].text
+        }
+    except Exception as e:
+        logger.error("Error fetching Zillow data: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+def parse_realtor_csv(buffer: BinaryIO, granularity: str) -> pd.DataFrame:
+    """解析Realtor.com CSV"""
+    # 根据粒度级别选择要读取的列
+    numeric_columns = REALTOR_NUMERIC_COLUMNS[1:]
+    region_col = REGION_COLUMNS[granularity]
+    
+    # pyarrow多线程解析，列裁剪和类型转换一次完成；zip code按字符串读取以保留前导零
+    table = pa_csv.read_csv(
+        buffer,
+        parse_options=pa_csv.ParseOptions(invalid_row_handler=skip_invalid_csv_row),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=['month_date_yyyymm'] + numeric_columns + [region_col],
+            column_types={
+                **{col: pa.float32() for col in numeric_columns},
+                region_col: pa.string()
             }
-        except Exception as e:
-            print(f"Error fetching Zillow data: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e))
+        )
+    )
+    df = table.to_pandas()
+    
+    # 文件末尾的说明行会让月份列被识别为字符串，单独转换为数字
+    df['month_date_yyyymm'] = pd.to_numeric(df['month_date_yyyymm'], errors='coerce')
+    
+    # 移除无效数据
+    df = df.dropna(subset=['month_date_yyyymm'] + numeric_columns)
+    return prepare_realtor_data(df, granularity)
+
+def prepare_realtor_data(df: pd.DataFrame, granularity: str) -> pd.DataFrame:
+    """预计算常用过滤列，并按(地区, 月份)建立排序索引，按地区查询时只需二分查找"""
+    region_col = REGION_COLUMNS[granularity]
+    df = df.astype({**REALTOR_DTYPES, region_col: 'category'})
+    months = df['month_date_yyyymm']
+    df['month_num'] = months % 100
+    df['is_pre_pandemic'] = (months >= 201601) & (months <= 201912)
+    df.index = pd.MultiIndex.from_arrays(
+        [df[region_col], months],
+        names=['region', 'month']
+    )
+    return df.sort_index()
+
+# 疫情前基准数据缓存：{granularity: (源DataFrame, 基准数据)}
+_baseline_cache: Dict[str, Tuple[pd.DataFrame, pd.DataFrame]] = {}
+
+def get_pre_pandemic_baseline(df: pd.DataFrame, granularity: str) -> pd.DataFrame:
+    """疫情前(2016-2019)各地区各月份有效数据（大于0）的平均值和数据点数量
+    
+    结果按(region, month_num)索引，每次数据重新加载后只计算一次
+    """
+    cached = _baseline_cache.get(granularity)
+    if cached is not None and cached[0] is df:
+        return cached[1]
+    
+    metric_columns = REALTOR_NUMERIC_COLUMNS[1:]
+    pre_pandemic = df[df['is_pre_pandemic']]
+    # 聚合使用float64，避免平均值带上float32的舍入误差
+    values = pre_pandemic[metric_columns].astype('float64')
+    grouped = values.where(values > 0).groupby([
+        pre_pandemic[REGION_COLUMNS[granularity]].rename('region'),
+        pre_pandemic['month_num']
+    ], observed=True)
+    baseline = grouped.mean().join(grouped.count().add_suffix('_count'))
+    
+    _baseline_cache[granularity] = (df, baseline)
+    return baseline
 
 async def fetch_realtor_data(granularity: str) -> pd.DataFrame:
     """获取Realtor.com数据"""
     url = REALTOR_URLS.get(granularity)
     if not url:
-        print(f"Invalid granularity level: {granularity}")
+        logger.warning("Invalid granularity level: %s", granularity)
         return pd.DataFrame()
     
-    print(f"Fetching data from {url}")
     # 对于zip level数据，使用更长的超时时间
     timeout = 60.0 if granularity == 'zip' else 30.0
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        try:
-            response = await client.get(url)
-            response.raise_for_status()
-            
-            if not response.text.strip():
-                print("Empty response")
-                return pd.DataFrame()
-            
-            # 根据粒度级别选择要读取的列
-            usecols = ['month_date_yyyymm', 'active_listing_count', 'pending_listing_count', 
-                      'median_days_on_market', 'price_reduced_count']
-            
-            if granularity == 'county':
-                usecols.extend(['county_name'])
-            elif granularity == 'zip':
-                usecols.extend(['postal_code'])
-            else:
-                usecols.append(REGION_COLUMNS[granularity])
-            
-            # 使用chunksize分批读取大文件
-            if granularity in ['zip', 'county']:
-                chunks = []
-                for chunk in pd.read_csv(StringIO(response.text), usecols=usecols, chunksize=10000, dtype={'postal_code': str}):
-                    # 数据类型转换
-                    chunk['month_date_yyyymm'] = pd.to_numeric(chunk['month_date_yyyymm'], errors='coerce')
-                    numeric_columns = ['active_listing_count', 'pending_listing_count', 
-                                     'median_days_on_market', 'price_reduced_count']
-                    
-                    for col in numeric_columns:
-                        chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
-                    
-                    # 移除无效数据
-                    chunk = chunk.dropna(subset=['month_date_yyyymm'] + numeric_columns)
-                    chunks.append(chunk)
-                
-                if not chunks:
-                    print("No valid data chunks found")
-                    return pd.DataFrame()
-                
-                df = pd.concat(chunks, ignore_index=True)
-                
-                # 确保zip code是字符串类型
-                if granularity == 'zip' and 'postal_code' in df.columns:
-                    df['postal_code'] = df['postal_code'].astype(str)
-            else:
-                df = pd.read_csv(StringIO(response.text), usecols=usecols)
-                # 数据类型转换
-                df['month_date_yyyymm'] = pd.to_numeric(df['month_date_yyyymm'], errors='coerce')
-                numeric_columns = ['active_listing_count', 'pending_listing_count', 
-                                 'median_days_on_market', 'price_reduced_count']
-                
-                for col in numeric_columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                
-                # 移除无效数据
-                df = df.dropna(subset=['month_date_yyyymm'] + numeric_columns)
-            
-            print(f"Successfully loaded {len(df)} rows of data")
-            return df
-            
-        except Exception as e:
-            print(f"Error fetching data: {str(e)}")
-            return pd.DataFrame()
+    cache_key = f"realtor:{granularity}"
+    
+    async def load() -> pd.DataFrame:
+        # 优先读取Parquet镜像，只读取需要的列
+        df = await read_parquet_mirror(
+            f"realtor_{granularity}",
+            REALTOR_NUMERIC_COLUMNS + [REGION_COLUMNS[granularity]]
+        )
+        if df is not None:
+            return prepare_realtor_data(df, granularity)
+        return await download_csv_dataframe(
+            cache_key,
+            url,
+            timeout,
+            lambda buffer: parse_realtor_csv(buffer, granularity)
+        )
+    
+    try:
+        df = await get_cached_dataframe(cache_key, load)
+        logger.debug("Successfully loaded %d rows of data", len(df))
+        return df
+        
+    except Exception as e:
+        logger.error("Error fetching data: %s", e)
+        return pd.DataFrame()
+
+# 供需均衡指标的保留小数位数，比率保留4位，其余保留2位
+MARKET_BALANCE_DECIMALS = {
+    'currentActive': 2,
+    'historicalActive': 2,
+    'changePercentage': 2,
+    'currentPending': 2,
+    'historicalPending': 2,
+    'pendingChange': 2,
+    'currentRatio': 4,
+    'historicalRatio': 4,
+    'ratioChange': 2
+}
 
-def calculate_metrics(df: pd.DataFrame, region_col: str) -> List[Dict]:
+def calculate_metrics(df: pd.DataFrame, granularity: str) -> pd.DataFrame:
     """计算供需均衡指标"""
     try:
         if df.empty:
-            print("输入数据为空")
-            return []
+            logger.warning("输入数据为空")
+            return pd.DataFrame()
 
         # 获取最新月份数据
         latest_month = df['month_date_yyyymm'].max()
         latest_month_num = latest_month % 100  # 获取月份数字
-        print(f"最新月份: {latest_month}, 月份数字: {latest_month_num}")
+        logger.debug("最新月份: %s, 月份数字: %s", latest_month, latest_month_num)
         
-        # 定义疫情前时期 (2016-2019)，只选择同月份的数据
-        pre_pandemic = df[
-            (df['month_date_yyyymm'] >= 201601) & 
-            (df['month_date_yyyymm'] <= 201912) &
-            (df['month_date_yyyymm'] % 100 == latest_month_num)  # 只选择同月份
-        ]
-        print(f"疫情前同月数据数量: {len(pre_pandemic)}")
+        # 疫情前时期 (2016-2019) 同月份的历史平均值和有效数据点数量
+        baseline = get_pre_pandemic_baseline(df, granularity)
+        if latest_month_num not in baseline.index.get_level_values('month_num'):
+            logger.warning("没有疫情前同月份数据: %s", latest_month_num)
+            return pd.DataFrame()
+        hist = baseline.xs(latest_month_num, level='month_num')
         
         # 获取当前月份数据
         current_data = df[df['month_date_yyyymm'] == latest_month]
-        print(f"当前月份数据数量: {len(current_data)}")
-        
-        results = []
-        for region in current_data[region_col].unique():
-            try:
-                # 获取当前数据
-                current_row = current_data[current_data[region_col] == region].iloc[0]
-                current_active = float(current_row['active_listing_count'])
-                current_pending = float(current_row['pending_listing_count'])
-                
-                # 获取疫情前该地区数据
-                historical_data = pre_pandemic[pre_pandemic[region_col] == region]
-                
-                # 只使用有效数据计算历史平均值
-                hist_active = historical_data['active_listing_count']
-                hist_pending = historical_data['pending_listing_count']
-                
-                # 过滤有效数据（大于0）
-                valid_active = hist_active[hist_active > 0]
-                valid_pending = hist_pending[hist_pending > 0]
-                
-                print(f"处理地区 {region}:")
-                print(f"  当前活跃列表: {current_active}")
-                print(f"  当前待定列表: {current_pending}")
-                print(f"  历史有效活跃数据点数量: {len(valid_active)}")
-                print(f"  历史有效待定数据点数量: {len(valid_pending)}")
-                
-                # 检查是否有足够的有效数据（至少3个历史数据点）
-                if len(valid_active) >= 3 and len(valid_pending) >= 3 and current_active > 0 and current_pending > 0:
-                    # 计算历史平均值
-                    hist_active_mean = valid_active.mean()
-                    hist_pending_mean = valid_pending.mean()
-                    
-                    # 检查数据是否满足最小样本量要求（30）
-                    if current_active < 30 or current_pending < 30 or hist_active_mean < 30 or hist_pending_mean < 30:
-                        print(f"  跳过地区 {region} - 样本量不足:")
-                        print(f"    当前活跃: {current_active:.2f}")
-                        print(f"    当前待定: {current_pending:.2f}")
-                        print(f"    历史活跃平均: {hist_active_mean:.2f}")
-                        print(f"    历史待定平均: {hist_pending_mean:.2f}")
-                        continue
-                    
-                    # 计算当前比率和历史比率
-                    current_ratio = current_pending / current_active
-                    historical_ratio = hist_pending_mean / hist_active_mean
-                    
-                    # 计算各项变化百分比
-                    active_change = ((current_active - hist_active_mean) / hist_active_mean) * 100
-                    pending_change = ((current_pending - hist_pending_mean) / hist_pending_mean) * 100
-                    ratio_change = ((current_ratio - historical_ratio) / historical_ratio) * 100
-                    
-                    print(f"  历史活跃平均值: {hist_active_mean}")
-                    print(f"  历史待定平均值: {hist_pending_mean}")
-                    print(f"  活跃变化百分比: {active_change}%")
-                    print(f"  待定变化百分比: {pending_change}%")
-                    print(f"  比率变化百分比: {ratio_change}%")
-                    
-                    if all(np.isfinite([active_change, pending_change, ratio_change])):
-                        results.append({
-                            'region': region,
-                            'currentActive': round(current_active, 2),
-                            'historicalActive': round(hist_active_mean, 2),
-                            'changePercentage': round(active_change, 2),
-                            'currentPending': round(current_pending, 2),
-                            'historicalPending': round(hist_pending_mean, 2),
-                            'pendingChange': round(pending_change, 2),
-                            'currentRatio': round(current_ratio, 4),
-                            'historicalRatio': round(historical_ratio, 4),
-                            'ratioChange': round(ratio_change, 2)
-                        })
-                    else:
-                        print(f"  跳过地区 {region} - 存在无效计算结果")
-                else:
-                    print(f"  跳过地区 {region} - 数据不足")
-            except Exception as e:
-                print(f"  处理地区 {region} 时出错: {str(e)}")
-                continue
-        
-        print(f"总共处理了 {len(results)} 个地区")
-        return results
+        logger.debug("当前月份数据数量: %d", len(current_data))
+        
+        count_columns = ['active_listing_count', 'pending_listing_count']
+        
+        # 每个地区取第一条当前数据
+        region_col = REGION_COLUMNS[granularity]
+        current = current_data.drop_duplicates(region_col).set_index(region_col)[count_columns].astype('float64')
+        merged = current.join(hist.add_prefix('hist_'), how='inner')
+        
+        # 检查是否有足够的有效数据（至少3个历史数据点）以及最小样本量要求（30）
+        merged = merged[
+            (merged['hist_active_listing_count_count'] >= 3) &
+            (merged['hist_pending_listing_count_count'] >= 3) &
+            (merged['active_listing_count'] >= 30) &
+            (merged['pending_listing_count'] >= 30) &
+            (merged['hist_active_listing_count'] >= 30) &
+            (merged['hist_pending_listing_count'] >= 30)
+        ]
+        
+        current_active = merged['active_listing_count']
+        current_pending = merged['pending_listing_count']
+        hist_active_mean = merged['hist_active_listing_count']
+        hist_pending_mean = merged['hist_pending_listing_count']
+        
+        # 计算当前比率和历史比率
+        current_ratio = current_pending / current_active
+        historical_ratio = hist_pending_mean / hist_active_mean
+        
+        # 计算各项变化百分比
+        results = pd.DataFrame({
+            'currentActive': current_active,
+            'historicalActive': hist_active_mean,
+            'changePercentage': (current_active - hist_active_mean) / hist_active_mean * 100,
+            'currentPending': current_pending,
+            'historicalPending': hist_pending_mean,
+            'pendingChange': (current_pending - hist_pending_mean) / hist_pending_mean * 100,
+            'currentRatio': current_ratio,
+            'historicalRatio': historical_ratio,
+            'ratioChange': (current_ratio - historical_ratio) / historical_ratio * 100
+        })
+        
+        # 移除存在无效计算结果的地区
+        results = results[np.isfinite(results).all(axis=1)]
+        
+        results = results.round(MARKET_BALANCE_DECIMALS)
+        
+        logger.info("总共处理了 %d 个地区", len(results))
+        return results.rename_axis('region').reset_index()
     except Exception as e:
-        print(f"计算指标时出错: {str(e)}")
-        return []
+        logger.error("计算指标时出错: %s", e)
+        return pd.DataFrame()
+
+# 各指标的排序键及对应的当前值、疫情前值列
+TOP_BOTTOM_COLUMNS = {
+    'active': ('changePercentage', 'currentActive', 'historicalActive'),
+    'pending': ('pendingChange', 'currentPending', 'historicalPending'),
+    'ratio': ('ratioChange', 'currentRatio', 'historicalRatio')
+}
 
-def get_top_bottom(data: List[Dict], metric: str, n: int = 10) -> Tuple[List[Dict], List[Dict]]:
+def get_top_bottom(data: pd.DataFrame, metric: str, n: int = 10) -> Tuple[List[Dict], List[Dict]]:
     """获取指标的前N和后N"""
     try:
-        if not data:
+        if data.empty:
             return [], []
             
         # 根据不同指标选择排序键
-        sort_key = {
-            'active': 'changePercentage',
-            'pending': 'pendingChange',
-            'ratio': 'ratioChange'
-        }.get(metric)
-        
-        if not sort_key:
-            print(f"未知的指标类型: {metric}")
+        if metric not in TOP_BOTTOM_COLUMNS:
+            logger.warning("未知的指标类型: %s", metric)
             return [], []
-            
-        # 按指标排序
-        sorted_data = sorted(data, key=lambda x: x[sort_key], reverse=True)
-        
-        # 获取前N和后N
-        top = sorted_data[:n]
-        bottom = sorted_data[-n:][::-1]  # 反转以保持从小到大顺序
-        
-        # 根据指标类型构造返回数据
-        if metric == 'active':
-            process = lambda x: {
-                'region': x['region'],
-                'current': x['currentActive'],
-                'prePandemic': x['historicalActive'],
-                'changePercentage': x['changePercentage']
-            }
-        elif metric == 'pending':
-            process = lambda x: {
-                'region': x['region'],
-                'current': x['currentPending'],
-                'prePandemic': x['historicalPending'],
-                'pendingChange': x['pendingChange']
-            }
-        else:  # ratio
-            process = lambda x: {
-                'region': x['region'],
-                'current': x['currentRatio'],
-                'prePandemic': x['historicalRatio'],
-                'ratioChange': x['ratioChange']
-            }
-            
-        return [process(x) for x in top], [process(x) for x in bottom]
+        sort_key, current_col, historical_col = TOP_BOTTOM_COLUMNS[metric]
+        
+        # 只选出前N和后N，无需完整排序；后N按从小到大顺序
+        columns = ['region', current_col, historical_col, sort_key]
+        renamed = {current_col: 'current', historical_col: 'prePandemic'}
+        top = data.nlargest(n, sort_key)[columns].rename(columns=renamed)
+        bottom = data.nsmallest(n, sort_key, keep='last')[columns].rename(columns=renamed)
+        
+        return top.to_dict('records'), bottom.to_dict('records')
         
     except Exception as e:
-        print(f"获取前N和后N时出错: {str(e)}")
+        logger.error("获取前N和后N时出错: %s", e)
         return [], []
 
 @app.get("/api/market-balance")
-async def get_market_balance():
+async def get_market_balance(response: Response):
     """获取市场供需平衡数据"""
     try:
-        print("开始获取市场平衡数据...")
         df = await fetch_realtor_data('metro')
         if df.empty:
-            print("Error: Empty DataFrame received from fetch_realtor_data")
-            return {
-                "active": {"top": [], "bottom": []},
-                "pending": {"top": [], "bottom": []},
-                "ratio": {"top": [], "bottom": []}
-            }
+            logger.error("Empty DataFrame received from fetch_realtor_data")
+            return {metric: {"top": [], "bottom": []} for metric in TOP_BOTTOM_COLUMNS}
         
-        print(f"成功获取数据，开始计算指标...")
-        results = calculate_metrics(df, REGION_COLUMNS['metro'])
-        if not results:
-            print("Error: No results from calculate_metrics")
-            return {
-                "active": {"top": [], "bottom": []},
-                "pending": {"top": [], "bottom": []},
-                "ratio": {"top": [], "bottom": []}
-            }
-            
-        print(f"计算完成，开始处理活跃列表变化...")
-        # 处理活跃列表变化
-        active_top, active_bottom = get_top_bottom(results, 'active')
-        
-        print(f"处理待定列表变化...")
-        # 处理待定列表变化
-        pending_top, pending_bottom = get_top_bottom(results, 'pending')
-        
-        print(f"处理比率变化...")
-        # 处理比率变化
-        ratio_top, ratio_bottom = get_top_bottom(results, 'ratio')
-        
-        response_data = {
-            "active": {
-                "top": active_top,
-                "bottom": active_bottom
-            },
-            "pending": {
-                "top": pending_top,
-                "bottom": pending_bottom
-            },
-            "ratio": {
-                "top": ratio_top,
-                "bottom": ratio_bottom
-            }
-        }
+        results = calculate_metrics(df, 'metro')
+        if results.empty:
+            logger.error("No results from calculate_metrics")
+            return {metric: {"top": [], "bottom": []} for metric in TOP_BOTTOM_COLUMNS}
         
-        print("返回数据示例:")
-        print("Active listings top 1:")
-        if active_top:
-            print(f"  {active_top[0]}")
-        print("Pending listings top 1:")
-        if pending_top:
-            print(f"  {pending_top[0]}")
-        print("Ratio listings top 1:")
-        if ratio_top:
-            print(f"  {ratio_top[0]}")
-            
+        # 依次处理活跃列表、待定列表和比率变化
+        response_data = {}
+        for metric in TOP_BOTTOM_COLUMNS:
+            top, bottom = get_top_bottom(results, metric)
+            response_data[metric] = {"top": top, "bottom": bottom}
+        
+        response.headers["Cache-Control"] = CACHE_CONTROL
         return response_data
         
     except Exception as e:
-        print(f"Error in get_market_balance: {str(e)}")
+        logger.error("Error in get_market_balance: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+# 地区列表JSON缓存：{granularity: (源DataFrame, JSON)}
+_regions_json_cache: Dict[str, Tuple[pd.DataFrame, bytes]] = {}
+
 @app.get("/api/regions")
 async def get_regions(granularity: str = Query(..., pattern="^(national|state|metro|county|zip)$")):
     try:
@@ -388,24 +491,31 @@ async def get_regions(granularity: str = Query(..., pattern="^(national|state|me
         if df.empty:
             return []
         
-        # 根据不同粒度级别选择正确的列名
-        region_col = REGION_COLUMNS[granularity]
-        
-        # 对于zip code，确保它是字符串类型
-        if granularity == 'zip':
-            df[region_col] = df[region_col].astype(str)
-        
-        regions = df[region_col].unique().tolist()
-        regions.sort()
-        
-        return [{"id": str(i), "name": name} for i, name in enumerate(regions)]
+        # 地区列表只随数据重新加载而变化，序列化后的JSON按数据缓存
+        cached = _regions_json_cache.get(granularity)
+        if cached is None or cached[0] is not df:
+            # 根据不同粒度级别选择正确的列名
+            region_col = REGION_COLUMNS[granularity]
+            
+            # 对于zip code，确保它是字符串类型
+            regions = sorted(str(name) for name in df[region_col].unique())
+            
+            cached = (df, orjson.dumps([{"id": str(i), "name": name} for i, name in enumerate(regions)]))
+            _regions_json_cache[granularity] = cached
+        
+        return Response(
+            content=cached[1],
+            media_type="application/json",
+            headers={"Cache-Control": CACHE_CONTROL}
+        )
             
     except Exception as e:
-        print(f"Error in get_regions: {str(e)}")
+        logger.error("Error in get_regions: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/metrics/{granularity}/{region}")
 async def get_metrics(
+    response: Response,
     granularity: str = Path(..., pattern="^(national|state|metro|county|zip)$"),
     region: str = Path(...)
 ):
@@ -415,307 +525,245 @@ async def get_metrics(
         if df.empty:
             return {}
         
-        # 根据不同粒度级别过滤数据
-        if granularity == 'county':
-            df = df[df['county_name'] == region]
-        elif granularity == 'zip':
-            df = df[df['postal_code'] == int(region)]
-        else:
-            region_col = REGION_COLUMNS[granularity]
-            df = df[df[region_col] == region]
-        
-        if df.empty:
+        # 共享缓存的数据已按(地区, 月份)排序索引，直接切片取出该地区数据
+        try:
+            region_df = df.loc[region]
+        except KeyError:
             return {}
         
+        baseline = get_pre_pandemic_baseline(df, granularity)
+        try:
+            region_baseline = baseline.loc[region]
+        except KeyError:
+            region_baseline = baseline.iloc[:0].droplevel('region')
+        
         # 获取最近12个月的数据
-        latest_month = df['month_date_yyyymm'].max()
+        latest_month = region_df.index.max()
         twelve_months_ago = latest_month - 100  # 简单的月份减法
         
-        recent_data = df[df['month_date_yyyymm'] > twelve_months_ago]
-        
-        metrics = {
-            'active_listing_count': [],
-            'pending_listing_count': [],
-            'pending_ratio': [],
-            'median_days_on_market': [],
-            'price_reduced_count': []
-        }
-        
-        for month in sorted(recent_data['month_date_yyyymm'].unique()):
-            month_data = recent_data[recent_data['month_date_yyyymm'] == month]
-            month_num = month % 100
-            
-            # 获取疫情前同月份的数据
-            historical_data = df[
-                (df['month_date_yyyymm'] >= 201601) & 
-                (df['month_date_yyyymm'] <= 201912) &
-                (df['month_date_yyyymm'] % 100 == month_num)
-            ]
-            
-            month_str = f"{int(month//100)}-{int(month%100):02d}"
-            
-            for metric in ['active_listing_count', 'pending_listing_count', 
-                          'median_days_on_market', 'price_reduced_count']:
-                try:
-                    current = float(month_data[metric].iloc[0])
-                    
-                    # 过滤有效的历史数据（大于0）
-                    valid_historical = historical_data[historical_data[metric] > 0]
-                    
-                    # 确保有足够的历史数据点（至少3个）
-                    if len(valid_historical) >= 3:
-                        historical = float(valid_historical[metric].mean())
-                        
-                        if np.isfinite(current) and np.isfinite(historical):
-                            pct_change = ((current - historical) / historical) * 100
-                        else:
-                            pct_change = None
-                    else:
-                        historical = None
-                        pct_change = None
-                        
-                    metrics[metric].append({
-                        'month': month_str,
-                        'current': current if np.isfinite(current) else None,
-                        'historical': historical if historical is not None and np.isfinite(historical) else None,
-                        'percentChange': round(pct_change, 2) if pct_change is not None else None
-                    })
-                except:
-                    continue
-            
-            # 计算pending ratio
-            try:
-                current_active = float(month_data['active_listing_count'].iloc[0])
-                current_pending = float(month_data['pending_listing_count'].iloc[0])
-                
-                # 过滤有效的历史数据
-                valid_hist_active = historical_data[historical_data['active_listing_count'] > 0]
-                valid_hist_pending = historical_data[historical_data['pending_listing_count'] > 0]
-                
-                # 确保有足够的历史数据点（至少3个）
-                if len(valid_hist_active) >= 3 and len(valid_hist_pending) >= 3:
-                    hist_active = float(valid_hist_active['active_listing_count'].mean())
-                    hist_pending = float(valid_hist_pending['pending_listing_count'].mean())
-                    
-                    if current_active > 0 and hist_active > 0:
-                        current_ratio = current_pending / current_active
-                        historical_ratio = hist_pending / hist_active
-                        pct_change = ((current_ratio - historical_ratio) / historical_ratio) * 100
-                        
-                        metrics['pending_ratio'].append({
-                            'month': month_str,
-                            'current': round(current_ratio, 4),
-                            'historical': round(historical_ratio, 4),
-                            'percentChange': round(pct_change, 2)
-                        })
-                else:
-                    metrics['pending_ratio'].append({
-                        'month': month_str,
-                        'current': round(current_pending / current_active, 4) if current_active > 0 else None,
-                        'historical': None,
-                        'percentChange': None
-                    })
-            except:
-                continue
-        
-        return metrics
+        recent_data = region_df.loc[twelve_months_ago + 1:]
+        recent_data = recent_data[~recent_data.index.duplicated()].astype(
+            {col: 'float64' for col in REALTOR_NUMERIC_COLUMNS[1:]}
+        )
+        
+        # 按月份数字对齐疫情前同月份的平均值和有效数据点数量
+        months = recent_data.index
+        historical_data = region_baseline.reindex(months % 100)
+        historical_data.index = months
+        month_str = (
+            (months // 100).astype(int).astype(str) + '-' +
+            (months % 100).astype(int).astype(str).str.zfill(2)
+        )
+        
+        metrics = {}
+        for metric in REALTOR_NUMERIC_COLUMNS[1:]:
+            current = recent_data[metric]
+            # 确保有足够的历史数据点（至少3个）
+            historical = historical_data[metric].where(historical_data[f'{metric}_count'] >= 3)
+            metrics[metric] = pd.DataFrame({
+                'month': month_str,
+                'current': current,
+                'historical': historical,
+                'percentChange': ((current - historical) / historical * 100).round(2)
+            }).to_dict('records')
+        
+        # 计算pending ratio
+        current_active = recent_data['active_listing_count']
+        current_ratio = (recent_data['pending_listing_count'] / current_active).where(current_active > 0)
+        has_history = (
+            (historical_data['active_listing_count_count'] >= 3) &
+            (historical_data['pending_listing_count_count'] >= 3)
+        )
+        historical_ratio = (
+            historical_data['pending_listing_count'] / historical_data['active_listing_count']
+        ).where(has_history)
+        pending_ratio = pd.DataFrame({
+            'month': month_str,
+            'current': current_ratio.round(4),
+            'historical': historical_ratio.round(4),
+            'percentChange': ((current_ratio - historical_ratio) / historical_ratio * 100).round(2)
+        })
+        # 有历史数据但当前活跃列表为0的月份不返回
+        metrics['pending_ratio'] = pending_ratio[~has_history | current_ratio.notna()].to_dict('records')
+        
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        return {key: metrics[key] for key in [
+            'active_listing_count',
+            'pending_listing_count',
+            'pending_ratio',
+            'median_days_on_market',
+            'price_reduced_count'
+        ]}
     except Exception as e:
-        print(f"Error in get_metrics: {str(e)}")
+        logger.error("Error in get_metrics: %s", e)
         return {}
 
+# 可负担性指标的保留小数位数。数据以float32缓存（约7位有效数字），输出时统一舍入：
+# 比率保留4位，月供保留2位，房价取整
+AFFORDABILITY_DECIMALS = {
+    'homeownerAffordability': 4,
+    'renterAffordability': 4,
+    'affordabilityGap': 4,
+    'gapTrend': 4,
+    'totalPayment': 2,
+    'mortgagePayment': 2,
+    'paymentGap': 2,
+    'affordablePrice': 0,
+    'medianPrice': 0,
+    'priceGap': 0,
+    'priceTrend': 0
+}
+
+# Zillow数据的日期列名格式：YYYY-MM-DD
+DATE_COLUMN_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+def get_date_columns(df: pd.DataFrame) -> pd.Index:
+    """获取日期列名"""
+    return df.columns[df.columns.str.match(DATE_COLUMN_RE)]
+
+def get_region_values(df: pd.DataFrame, region: str, date_columns: pd.Index) -> np.ndarray:
+    """取出地区在各日期上的数值，数据集缺少的日期为NaN"""
+    if df.empty:
+        return np.full(len(date_columns), np.nan)
+    
+    # RegionName是唯一索引，get_loc是一次哈希查找；直接从float32数组中取行，计算前转为float64
+    row = df.to_numpy()[df.index.get_loc(region)]
+    if not df.columns.equals(date_columns):
+        values = np.full(len(date_columns), np.nan)
+        values[date_columns.get_indexer(df.columns)] = row
+        return values
+    return row.astype(np.float64)
+
+def prepare_zillow_data(df: pd.DataFrame) -> pd.DataFrame:
+    """以RegionName为索引，只保留按日期排序的数值列（float32存储）"""
+    date_columns = get_date_columns(df).sort_values()
+    values = df.drop_duplicates('RegionName').set_index('RegionName')[date_columns]
+    # pyarrow按列推断类型（整数列、全空列），各类型分属不同的block，astype也不会合并；
+    # 从一个二维数组重建，保证to_numpy()返回视图而不是整表拷贝
+    return pd.DataFrame(
+        values.to_numpy(dtype=np.float32),
+        index=values.index,
+        columns=date_columns
+    )
+
+def parse_zillow_csv(buffer: BinaryIO, data_type: str) -> pd.DataFrame:
+    """解析Zillow可负担性CSV"""
+    df = pa_csv.read_csv(
+        buffer,
+        parse_options=pa_csv.ParseOptions(invalid_row_handler=skip_invalid_csv_row)
+    ).to_pandas()
+    logger.debug("DataFrame shape for %s: %s", data_type, df.shape)
+    
+    return prepare_zillow_data(df)
+
 async def fetch_zillow_affordability_data(data_type: str) -> pd.DataFrame:
     """获取Zillow可负担性数据"""
     url = ZILLOW_AFFORDABILITY_URLS.get(data_type)
     if not url:
-        print(f"Invalid data type: {data_type}")
+        logger.warning("Invalid data type: %s", data_type)
         return pd.DataFrame()
     
-    print(f"Fetching {data_type} data from {url}")
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            print(f"Sending request to {url}")
-            response = await client.get(url)
-            print(f"Response status code: {response.status_code}")
-            response.raise_for_status()
-            
-            if not response.text.strip():
-                print("Empty response")
-                return pd.DataFrame()
-            
-            print(f"Response content length: {len(response.text)}")
-            print(f"First 200 characters of response: {response.text[:200]}")
-            
-            df = pd.read_csv(StringIO(response.text))
-            print(f"DataFrame shape: {df.shape}")
-            print(f"DataFrame columns: {df.columns.tolist()}")
-            
-            # 修改日期列名处理逻辑
-            date_columns = [col for col in df.columns if re.match(r'^\d{4}-\d{2}-\d{2}$', col)]
-            print(f"Found {len(date_columns)} date columns")
-            renamed_columns = {}
-            for col in date_columns:
-                # 保留原始日期列名，不再截断到月份
-                renamed_columns[col] = col
-            
-            # 重命名列
-            df = df.rename(columns=renamed_columns)
-            
-            print(f"Raw columns for {data_type}: {list(df.columns)}")
-            print(f"Renamed columns for {data_type}: {list(df.columns)}")
-            print(f"Sample data for {data_type}:")
-            print(df.head())
-            
-            return df
-            
-        except Exception as e:
-            print(f"Error fetching {data_type} data: {str(e)}")
-            print(f"Error type: {type(e)}")
-            print(f"Error details: {e.__dict__}")
-            return pd.DataFrame()
+    cache_key = f"zillow:{data_type}"
+    
+    async def load() -> pd.DataFrame:
+        # 优先读取Parquet镜像，镜像中只有RegionName和日期列
+        df = await read_parquet_mirror(f"zillow_{data_type}")
+        if df is not None:
+            return prepare_zillow_data(df)
+        return await download_csv_dataframe(
+            cache_key,
+            url,
+            30.0,
+            lambda buffer: parse_zillow_csv(buffer, data_type)
+        )
+    
+    try:
+        return await get_cached_dataframe(cache_key, load)
+        
+    except Exception as e:
+        logger.exception("Error fetching %s data: %s", data_type, e)
+        return pd.DataFrame()
 
-def calculate_affordability_metrics(homeowner_df: pd.DataFrame, renter_df: pd.DataFrame) -> List[Dict]:
-    """计算可负担性指标"""
+def calculate_affordability_metrics(homeowner_df: pd.DataFrame, renter_df: pd.DataFrame) -> pd.DataFrame:
+    """计算可负担性指标，按可负担性差距降序排列，无效值在末尾"""
     try:
         if homeowner_df.empty or renter_df.empty:
-            print("输入数据为空")
-            return []
+            logger.warning("输入数据为空")
+            return pd.DataFrame()
+        
+        # 日期列在加载时已排序，最后一列即最新月份
+        latest_month = homeowner_df.columns[-1]
+        logger.debug("最新月份: %s", latest_month)
+        
+        if latest_month not in renter_df.columns:
+            logger.warning("租户数据缺少最新月份: %s", latest_month)
+            return pd.DataFrame()
+        
+        # 取出最新月份数据，按RegionName索引对齐房主和租户数据
+        homeowner = homeowner_df[latest_month].astype(np.float64).rename('homeownerAffordability')
+        renter = renter_df[latest_month].astype(np.float64).rename('renterAffordability')
+        
+        # 只保留有有效租户数据的地区
+        merged = homeowner.to_frame().join(renter, how='inner')
+        merged = merged[merged['renterAffordability'].notna() & (merged['renterAffordability'] != 0)]
         
-        # 获取最新月份的列名（除了RegionID等非月份列）
-        date_columns = [col for col in homeowner_df.columns 
-                       if re.match(r'\d{4}-\d{2}', col)]
-        latest_month = sorted(date_columns)[-1]
-        print(f"最新月份: {latest_month}")
-        
-        results = []
-        total_regions = len(homeowner_df)
-        processed_regions = 0
-        valid_results = 0
-        invalid_results = 0
-        
-        for _, homeowner_row in homeowner_df.iterrows():
-            try:
-                region = homeowner_row['RegionName']
-                processed_regions += 1
-                print(f"\n处理地区 ({processed_regions}/{total_regions}): {region}")
-                
-                # 检查是否存在匹配的租户数据
-                renter_data = renter_df[renter_df['RegionName'] == region]
-                if renter_data.empty:
-                    print(f"地区 {region} 没有租户数据")
-                    invalid_results += 1
-                    continue
-                
-                # 获取租户数据
-                try:
-                    renter_row = renter_data.iloc[0]
-                    renter_value = float(renter_row[latest_month])
-                    if pd.isna(renter_value) or renter_value == 0:
-                        print(f"地区 {region} 的租户数据无效: {renter_value}")
-                        invalid_results += 1
-                        continue
-                    print(f"租户可负担性: {renter_value}")
-                except (KeyError, IndexError, ValueError) as e:
-                    print(f"地区 {region} 的租户数据访问错误: {str(e)}")
-                    invalid_results += 1
-                    continue
-                
-                # 获取房主数据
-                try:
-                    homeowner_value = float(homeowner_row[latest_month])
-                    if pd.isna(homeowner_value) or homeowner_value == 0:
-                        print(f"地区 {region} 的房主数据无效: {homeowner_value}")
-                        homeowner_value = None
-                    print(f"房主可负担性: {homeowner_value}")
-                except (ValueError, KeyError) as e:
-                    print(f"地区 {region} 的房主数据错误: {str(e)}")
-                    homeowner_value = None
-                
-                # 计算可负担性差距
-                affordability_gap = None
-                if homeowner_value is not None:
-                    affordability_gap = homeowner_value - renter_value
-                    print(f"可负担性差距: {affordability_gap}")
-                
-                results.append({
-                    'region': region,
-                    'homeownerAffordability': homeowner_value,
-                    'renterAffordability': renter_value,
-                    'affordabilityGap': affordability_gap
-                })
-                
-                if affordability_gap is not None:
-                    valid_results += 1
-                else:
-                    invalid_results += 1
-                
-            except Exception as e:
-                print(f"处理地区 {region} 时发生错误: {str(e)}")
-                invalid_results += 1
-                continue
-        
-        print(f"\n处理完成:")
-        print(f"总地区数: {total_regions}")
-        print(f"处理地区数: {processed_regions}")
-        print(f"有效结果数: {valid_results}")
-        print(f"无效结果数: {invalid_results}")
-        
-        # 分离有效值和无效值
-        valid_results = [r for r in results if r['affordabilityGap'] is not None]
-        invalid_results = [r for r in results if r['affordabilityGap'] is None]
-        
-        # 只对有效值进行排序
-        sorted_valid_results = sorted(valid_results, key=lambda x: x['affordabilityGap'], reverse=True)
-        
-        # 将无效值添加到末尾
-        sorted_results = sorted_valid_results + invalid_results
-        
-        print(f"\n排序后的结果示例:")
-        if sorted_results:
-            print(f"第一条记录: {sorted_results[0]}")
-            if len(sorted_results) > 1:
-                print(f"第二条记录: {sorted_results[1]}")
-        
-        return sorted_results
+        # 房主数据为0视为无效，无效时可负担性差距为空
+        merged['homeownerAffordability'] = merged['homeownerAffordability'].where(
+            merged['homeownerAffordability'] != 0
+        )
+        merged['affordabilityGap'] = merged['homeownerAffordability'] - merged['renterAffordability']
+        
+        valid_count = int(merged['affordabilityGap'].notna().sum())
+        logger.info(
+            "处理完成: 总地区数 %d, 有效结果数 %d, 无效结果数 %d",
+            len(homeowner_df), valid_count, len(homeowner_df) - valid_count
+        )
+        
+        # 有效值按差距降序排列，无效值放在末尾
+        merged = merged.sort_values('affordabilityGap', ascending=False, na_position='last', kind='stable')
+        merged = merged.round(AFFORDABILITY_DECIMALS)
+        return merged.rename_axis('region').reset_index()
         
     except Exception as e:
-        print(f"计算可负担性指标时发生错误: {str(e)}")
-        return []
+        logger.error("计算可负担性指标时发生错误: %s", e)
+        return pd.DataFrame()
 
-def calculate_regression_trend(data: List[float]) -> List[float]:
+def calculate_regression_trend(data: np.ndarray) -> np.ndarray:
     """使用最近6个月的数据计算回归趋势"""
+    trend = np.full(len(data), np.nan)
     if len(data) < 3:  # 至少需要3个点才能计算趋势
-        return [None] * len(data)
+        return trend
     
     # 移除无效值
-    valid_data = [(i, x) for i, x in enumerate(data) if x is not None and not np.isnan(x)]
-    if len(valid_data) < 3:  # 确保有足够的有效数据点
-        return [None] * len(data)
+    valid_indices = np.flatnonzero(~np.isnan(data))
+    if len(valid_indices) < 3:  # 确保有足够的有效数据点
+        return trend
     
     # 只使用最近6个月的有效数据
-    valid_indices, valid_values = zip(*valid_data[-6:])
-    x = np.array(valid_indices)
-    y = np.array(valid_values)
+    valid_indices = valid_indices[-6:]
+    x = valid_indices.astype(np.float64)
+    y = data[valid_indices]
     
-    try:
-        # 计算趋势线
-        slope, intercept = np.polyfit(x, y, 1)
-        
-        # 生成趋势线值
-        trend_values = [None] * len(data)
-        for i in range(len(data)):
-            if i >= valid_indices[0]:  # 只为有效数据范围生成趋势值
-                trend_values[i] = slope * i + intercept
-        return trend_values
-    except:
-        return [None] * len(data)
+    # 最小二乘直线的闭式解，点数很少时比np.polyfit快得多
+    mean_x = x.mean()
+    mean_y = y.mean()
+    slope = ((x - mean_x) * (y - mean_y)).sum() / ((x - mean_x) ** 2).sum()
+    intercept = mean_y - slope * mean_x
+    
+    # 只为有效数据范围生成趋势值
+    start = valid_indices[0]
+    trend[start:] = slope * np.arange(start, len(data)) + intercept
+    return trend
 
 @app.get("/api/affordability-summary")
-async def get_affordability_summary():
+async def get_affordability_summary(response: Response):
     """获取可负担性汇总数据"""
     try:
-        print("开始获取可负担性汇总数据...")
-        homeowner_df = await fetch_zillow_affordability_data('homeowner')
-        renter_df = await fetch_zillow_affordability_data('renter')
+        # 并发获取房主和租户数据
+        homeowner_df, renter_df = await asyncio.gather(
+            fetch_zillow_affordability_data('homeowner'),
+            fetch_zillow_affordability_data('renter')
+        )
         
         if homeowner_df.empty or renter_df.empty:
             return {
@@ -724,161 +772,124 @@ async def get_affordability_summary():
             }
         
         results = calculate_affordability_metrics(homeowner_df, renter_df)
-        if not results:
+        if results.empty:
             return {
                 "leastAffordable": [],
                 "mostAffordable": []
             }
         
-        # 分离有效值和无效值
-        valid_results = [r for r in results if r['affordabilityGap'] is not None]
-        invalid_results = [r for r in results if r['affordabilityGap'] is None]
-        
-        # 只对有效值进行排序
-        sorted_valid_results = sorted(valid_results, key=lambda x: x['affordabilityGap'], reverse=True)
-        
-        # 将无效值添加到末尾
-        sorted_results = sorted_valid_results + invalid_results
+        # 结果已按差距降序排列且无效值在末尾，先切片再转换为记录
+        valid_count = int(results['affordabilityGap'].notna().sum())
+        least_affordable = results.head(10)  # 有效值不足10个时由末尾的无效值补足
+        most_affordable = results.iloc[:valid_count].tail(10).iloc[::-1]
         
+        response.headers["Cache-Control"] = CACHE_CONTROL
         return {
-            "leastAffordable": sorted_results[:10],  # 最不可负担的10个市场
-            "mostAffordable": sorted_valid_results[-10:][::-1]  # 最可负担的10个市场（只从有效值中选择）
+            "leastAffordable": least_affordable.to_dict('records'),  # 最不可负担的10个市场
+            "mostAffordable": most_affordable.to_dict('records')  # 最可负担的10个市场（只从有效值中选择）
         }
         
     except Exception as e:
-        print(f"Error in get_affordability_summary: {str(e)}")
+        logger.error("Error in get_affordability_summary: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/affordability-metrics/{region}")
 async def get_affordability_metrics(region: str):
     try:
-        print(f"Processing data for {region}")
-        
-        # 获取所有数据集
-        homeowner_df = await fetch_zillow_affordability_data("homeowner")
-        renter_df = await fetch_zillow_affordability_data("renter")
-        total_payment_df = await fetch_zillow_affordability_data("total_payment")
-        mortgage_payment_df = await fetch_zillow_affordability_data("mortgage_payment")
-        affordable_price_df = await fetch_zillow_affordability_data("affordable_price")
-        median_price_df = await fetch_zillow_affordability_data("median_price")
-
-        # 找到目标地区的数据
-        region_data = []
-        
-        # 获取所有日期列
-        date_pattern = r'^\d{4}-\d{2}-\d{2}$'
-        all_date_columns = set()
-        
-        for df in [homeowner_df, renter_df, total_payment_df, mortgage_payment_df, 
-                  affordable_price_df, median_price_df]:
-            if df is not None:
-                date_cols = [col for col in df.columns if re.match(date_pattern, col)]
-                all_date_columns.update(date_cols)
-        
-        all_date_columns = sorted(list(all_date_columns))
-        print(f"All available date columns: {all_date_columns}")
-
-        # 对每个日期创建一个数据点
-        for date in all_date_columns:
-            data_point = {"month": date.split('-')[0] + '-' + date.split('-')[1]}
-            
-            # 获取各个指标的值（如果可用）
-            if homeowner_df is not None and date in homeowner_df.columns:
-                homeowner_value = homeowner_df[homeowner_df['RegionName'] == region][date].iloc[0]
-                data_point["homeownerAffordability"] = float(homeowner_value) if pd.notna(homeowner_value) else None
-            else:
-                data_point["homeownerAffordability"] = None
-                
-            if renter_df is not None and date in renter_df.columns:
-                renter_value = renter_df[renter_df['RegionName'] == region][date].iloc[0]
-                data_point["renterAffordability"] = float(renter_value) if pd.notna(renter_value) else None
-            else:
-                data_point["renterAffordability"] = None
-                
-            # 计算可负担性差距（如果两个值都可用）
-            if data_point["homeownerAffordability"] is not None and data_point["renterAffordability"] is not None:
-                data_point["affordabilityGap"] = data_point["homeownerAffordability"] - data_point["renterAffordability"]
-            else:
-                data_point["affordabilityGap"] = None
-                
-            # 获取支付相关的值
-            if total_payment_df is not None and date in total_payment_df.columns:
-                total_value = total_payment_df[total_payment_df['RegionName'] == region][date].iloc[0]
-                data_point["totalPayment"] = float(total_value) if pd.notna(total_value) else None
-            else:
-                data_point["totalPayment"] = None
-                
-            if mortgage_payment_df is not None and date in mortgage_payment_df.columns:
-                mortgage_value = mortgage_payment_df[mortgage_payment_df['RegionName'] == region][date].iloc[0]
-                data_point["mortgagePayment"] = float(mortgage_value) if pd.notna(mortgage_value) else None
-            else:
-                data_point["mortgagePayment"] = None
-                
-            # 计算支付差距（如果两个值都可用）
-            if data_point["totalPayment"] is not None and data_point["mortgagePayment"] is not None:
-                data_point["paymentGap"] = data_point["totalPayment"] - data_point["mortgagePayment"]
-            else:
-                data_point["paymentGap"] = None
-                
-            # 获取价格相关的值
-            if affordable_price_df is not None and date in affordable_price_df.columns:
-                affordable_value = affordable_price_df[affordable_price_df['RegionName'] == region][date].iloc[0]
-                data_point["affordablePrice"] = float(affordable_value) if pd.notna(affordable_value) else None
-            else:
-                data_point["affordablePrice"] = None
-                
-            if median_price_df is not None and date in median_price_df.columns:
-                median_value = median_price_df[median_price_df['RegionName'] == region][date].iloc[0]
-                data_point["medianPrice"] = float(median_value) if pd.notna(median_value) else None
-            else:
-                data_point["medianPrice"] = None
-                
-            # 计算价格差距（如果两个值都可用）
-            if data_point["affordablePrice"] is not None and data_point["medianPrice"] is not None:
-                data_point["priceGap"] = data_point["medianPrice"] - data_point["affordablePrice"]
-            else:
-                data_point["priceGap"] = None
-                
-            region_data.append(data_point)
-            
-        # 按月份排序
-        region_data.sort(key=lambda x: x['month'])
-        
-        # 计算趋势线
-        # 对于可负担性差距
-        gap_values = [d["affordabilityGap"] for d in region_data]
-        gap_trends = calculate_regression_trend(gap_values)
-        for i, trend in enumerate(gap_trends):
-            region_data[i]["gapTrend"] = trend
-            
-        # 对于价格差距
-        price_gap_values = [d["priceGap"] for d in region_data]
-        price_trends = calculate_regression_trend(price_gap_values)
-        for i, trend in enumerate(price_trends):
-            region_data[i]["priceTrend"] = trend
+        logger.debug("Processing data for %s", region)
+        
+        # 并发获取所有数据集
+        (homeowner_df, renter_df, total_payment_df, mortgage_payment_df,
+         affordable_price_df, median_price_df) = await asyncio.gather(
+            fetch_zillow_affordability_data("homeowner"),
+            fetch_zillow_affordability_data("renter"),
+            fetch_zillow_affordability_data("total_payment"),
+            fetch_zillow_affordability_data("mortgage_payment"),
+            fetch_zillow_affordability_data("affordable_price"),
+            fetch_zillow_affordability_data("median_price")
+        )
+
+        datasets = [homeowner_df, renter_df, total_payment_df, mortgage_payment_df,
+                    affordable_price_df, median_price_df]
+        
+        # 合并所有数据集的日期列（Index.union会排序）
+        all_date_columns = reduce(
+            lambda a, b: a.union(b),
+            [df.columns for df in datasets],
+            pd.Index([], dtype=object)
+        )
+        logger.debug("Found %d date columns", len(all_date_columns))
+
+        # 每个数据集只定位一次目标地区所在行，按日期对齐为数组
+        (homeowner_values, renter_values, total_payment_values, mortgage_payment_values,
+         affordable_price_values, median_price_values) = [
+            get_region_values(df, region, all_date_columns) for df in datasets
+        ]
+        
+        # 计算各项差距（任一值缺失时结果为NaN）
+        affordability_gap = homeowner_values - renter_values
+        payment_gap = total_payment_values - mortgage_payment_values
+        price_gap = median_price_values - affordable_price_values
+        
+        region_data = pd.DataFrame({
+            "month": all_date_columns.str.slice(0, 7),
+            "homeownerAffordability": homeowner_values,
+            "renterAffordability": renter_values,
+            "affordabilityGap": affordability_gap,
+            "totalPayment": total_payment_values,
+            "mortgagePayment": mortgage_payment_values,
+            "paymentGap": payment_gap,
+            "affordablePrice": affordable_price_values,
+            "medianPrice": median_price_values,
+            "priceGap": price_gap
+        })
+        
+        # 日期列已按YYYY-MM-DD排序，月份无需再排序
+        # 计算趋势线：可负担性差距和价格差距
+        region_data["gapTrend"] = calculate_regression_trend(region_data["affordabilityGap"].to_numpy())
+        region_data["priceTrend"] = calculate_regression_trend(region_data["priceGap"].to_numpy())
+        region_data = region_data.round(AFFORDABILITY_DECIMALS)
 
-        return region_data
+        # 有数据集加载失败时不允许CDN缓存，下一次请求会重新下载
+        headers = None if any(df.empty for df in datasets) else {"Cache-Control": CACHE_CONTROL}
+        
+        # 直接返回ORJSONResponse，跳过FastAPI的jsonable_encoder；orjson会把NaN输出为null
+        return ORJSONResponse(
+            content=region_data.to_dict('records'),
+            headers=headers
+        )
         
     except Exception as e:
-        print(f"Error processing data for {region}: {str(e)}")
+        logger.error("Error processing data for %s: %s", region, e)
         raise HTTPException(status_code=500, detail=str(e))
 
+_affordability_regions_json_cache: Optional[Tuple[pd.DataFrame, bytes]] = None
+
 @app.get("/api/affordability-regions")
 async def get_affordability_regions():
     """获取Zillow可负担性数据中的地区列表"""
+    global _affordability_regions_json_cache
     try:
         # 获取Zillow数据中的地区列表
         homeowner_df = await fetch_zillow_affordability_data('homeowner')
         if homeowner_df.empty:
             return []
         
-        regions = homeowner_df['RegionName'].unique().tolist()
-        regions.sort()
-        
-        return [{"id": str(i), "name": region} for i, region in enumerate(regions)]
+        # 与/api/regions相同，序列化后的JSON按数据缓存
+        cached = _affordability_regions_json_cache
+        if cached is None or cached[0] is not homeowner_df:
+            regions = sorted(homeowner_df.index)
+            cached = (homeowner_df, orjson.dumps([{"id": str(i), "name": region} for i, region in enumerate(regions)]))
+            _affordability_regions_json_cache = cached
+        
+        return Response(
+            content=cached[1],
+            media_type="application/json",
+            headers={"Cache-Control": CACHE_CONTROL}
+        )
             
     except Exception as e:
-        print(f"Error in get_affordability_regions: {str(e)}")
+        logger.error("Error in get_affordability_regions: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":